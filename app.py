@@ -1,10 +1,14 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import matplotlib
+matplotlib.use('agg')  # Backend sem interface gráfica, definido antes de criar qualquer figura
+from matplotlib.figure import Figure
 import io
+import codecs
 import numpy as np
 import re
+import plotly.express as px
+from dataclasses import dataclass
 
 # Configuração da página
 st.set_page_config(
@@ -24,8 +28,52 @@ cores_cbmpr = {
     'preto': '#373435'
 }
 
-# CSS personalizado para a aplicação
-st.markdown(f"""
+# Hierarquia militar dos postos/graduações, do menor para o maior (Coronel no topo dos gráficos)
+HIERARQUIA = [
+    'Soldado 2ª Classe', 'Soldado 1ª Classe', 'Cabo', '3º Sargento', '2º Sargento', '1º Sargento',
+    'Subtenente', 'Aluno de 1º Ano', 'Aluno de 2º Ano', 'Aluno de 3º Ano', 'Aspirante a Oficial',
+    '2º Tenente 6', '2º Tenente', '1º Tenente', 'Capitão', 'Major', 'Tenente Coronel', 'Coronel'
+]
+
+# Possíveis nomes da coluna de Unidade de Trabalho, em ordem de preferência
+COLUNAS_UNIDADE = ('Descrição da Unidade de Trabalho', 'Unidade de Trabalho', 'Unidade')
+
+# Padrão da linha de cabeçalho do CSV da SEAP (ID, Nome, RG), com o delimitador capturado;
+# aceita a marca de ordem de bytes (BOM) UTF-8 antes de um cabeçalho na primeira linha
+_HEADER_RE = re.compile(
+    rb'^(?:\xef\xbb\xbf)?(?P<cabecalho>ID(?P<delimitador>[,;])Nome(?P=delimitador)RG)',
+    re.MULTILINE
+)
+
+# Primeiro byte fora do ASCII, a partir do qual a codificação do arquivo é detectada
+_NAO_ASCII_RE = re.compile(rb'[\x80-\xff]')
+
+# Faixas etárias usadas nos gráficos e tabelas (intervalos fechados à direita)
+FAIXAS_ETARIAS_BINS = np.array([18, 25, 30, 35, 40, 45, 50, 55, 60], dtype=np.float32)
+FAIXAS_ETARIAS_LABELS = ['18-25', '26-30', '31-35', '36-40', '41-45', '46-50', '51-55', '56+']
+
+# Cores das barras usando a paleta CBMPR: uma por faixa etária e, em ciclo, por posto/graduação
+CORES_FAIXAS_ETARIAS = [
+    cores_cbmpr['azul_escuro'],
+    cores_cbmpr['vermelho'],
+    cores_cbmpr['amarelo'],
+    cores_cbmpr['cinza_escuro'],
+    cores_cbmpr['cinza_claro'],
+    cores_cbmpr['preto'],
+    cores_cbmpr['azul_escuro'],
+    cores_cbmpr['vermelho']
+]
+# Azul escuro, vermelho, amarelo, cinza escuro, cinza claro, verde, preto (sem usar branco)
+CORES_CARGOS = ['#062733', '#D34339', '#FFD928', '#606062', '#A39B96', '#2E8B57', '#373435']
+
+# Estilo comum dos gráficos, aplicado uma única vez (títulos e rótulos dos eixos)
+matplotlib.rcParams.update({
+    'axes.titlesize': 16,
+    'axes.labelsize': 12,
+})
+
+# CSS personalizado para a aplicação, montado como constante (as cores não mudam)
+_CSS_HTML = f"""
 <style>
     .stApp {{
         background-color: {cores_cbmpr['branco']};
@@ -103,7 +151,43 @@ st.markdown(f"""
         box-shadow: 0 4px 8px rgba(0,0,0,0.1);
     }}
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# Injetar o CSS em toda reexecução, pois o Streamlit remove da página os elementos
+# que não são emitidos novamente
+st.markdown(_CSS_HTML, unsafe_allow_html=True)
+
+# Função para criar uma figura com um único eixo
+def _nova_figura(largura, altura):
+    """
+    Cria a figura diretamente (sem pyplot), fora do gerenciador global de figuras:
+    a figura é descartada pelo coletor de lixo após o uso, sem precisar de plt.close
+    """
+    fig = Figure(figsize=(largura, altura))
+    return fig, fig.subplots()
+
+# Função para calcular a chave de cache de um DataFrame a partir do seu conteúdo
+def _hash_dataframe(df):
+    # Nomes e tipos das colunas entram na chave, pois hash_pandas_object considera apenas os valores
+    return (
+        tuple(df.columns),
+        tuple(df.dtypes.astype(str)),
+        pd.util.hash_pandas_object(df, index=True).values.tobytes()
+    )
+
+# Função para converter um DataFrame em bytes CSV para download (resultado em cache)
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _hash_dataframe})
+def converter_para_csv(df):
+    # Escrever direto em bytes, sem montar antes o texto CSV inteiro como str
+    buf = io.BytesIO()
+    df.to_csv(buf, index=False, encoding='utf-8', chunksize=50_000)
+    return buf.getvalue()
+
+# Função para renderizar uma figura em bytes PNG para download
+def renderizar_png(fig, dpi):
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=dpi, bbox_inches='tight')
+    return buf.getvalue()
 
 # Função para adicionar a seção de amostra de dados filtrados
 def adicionar_secao_amostra_dados(df, filtro_abono=None):
@@ -112,21 +196,27 @@ def adicionar_secao_amostra_dados(df, filtro_abono=None):
     O dataframe df já deve estar com todos os filtros aplicados
     """
     # Limpar dados antes de exibir - remover possíveis linhas de totais ou vazias
-    df_limpo = df.copy()
+    # (cada filtro gera um novo DataFrame, então não é preciso copiar o original)
+    if filtro_abono is not None and 'Recebe Abono Permanência' in df.columns:
+        df = df.loc[df['Recebe Abono Permanência'] == filtro_abono]
     
     # Remover linhas totalmente vazias
-    df_limpo = df_limpo.dropna(how='all')
+    df_limpo = df.dropna(how='all')
     
-    # Identificar e remover linhas de totais (se existirem)
+    # Identificar linhas de totais (se existirem) e com ID vazio em uma única máscara, aplicada uma vez
+    manter = np.ones(len(df_limpo), dtype=bool)
     if 'Nome' in df_limpo.columns:
         # Remover linhas onde o Nome contém "total", "totais", etc.
-        df_limpo = df_limpo[~df_limpo['Nome'].astype(str).str.lower().str.contains('total')]
+        manter &= ~df_limpo['Nome'].astype(str).str.contains('total', case=False, regex=False).to_numpy()
     
-    # Remover linhas onde o ID está vazio ou contém "total"
-    if 'ID' in df_limpo.columns:
+    # Remover linhas onde o ID está vazio ou contém "total" (IDs já numéricos não podem conter texto)
+    if 'ID' in df_limpo.columns and not pd.api.types.is_numeric_dtype(df_limpo['ID']):
         # Converter para string primeiro para evitar erros com NaN
-        df_limpo = df_limpo[~df_limpo['ID'].astype(str).str.lower().str.contains('total')]
-        df_limpo = df_limpo[df_limpo['ID'].astype(str).str.strip() != '']
+        id_texto = df_limpo['ID'].astype(str)
+        manter &= ~id_texto.str.contains('total', case=False, regex=False).to_numpy()
+        manter &= (id_texto.str.strip() != '').to_numpy()
+    
+    df_limpo = df_limpo[manter]
     
     # Ordenar os dados alfabeticamente por Nome, se a coluna existir
     if 'Nome' in df_limpo.columns:
@@ -149,7 +239,7 @@ def adicionar_secao_amostra_dados(df, filtro_abono=None):
         st.info(f"Mostrando todos os {len(df_ordenado)} registros. Use a barra de rolagem para navegar.")
         
         # Opção para download dos dados filtrados completos (também ordenados)
-        csv_dados = df_ordenado.to_csv(index=False).encode('utf-8')
+        csv_dados = converter_para_csv(df_ordenado)
         st.download_button(
             label="📥 Download dos Dados Filtrados (CSV)",
             data=csv_dados,
@@ -157,86 +247,170 @@ def adicionar_secao_amostra_dados(df, filtro_abono=None):
             mime="text/csv"
         )
 
+# Função para encontrar a coluna de Unidade de Trabalho do DataFrame (None se não existir)
+def obter_coluna_unidade(df):
+    return next((coluna for coluna in COLUNAS_UNIDADE if coluna in df.columns), None)
+
+# Função para otimizar os tipos das colunas mais consultadas nos filtros e gráficos
+def _otimizar_tipos(df):
+    """
+    Converte Idade para Int16 (ou float32, se houver idades fracionárias), ID para inteiro e as colunas de texto com poucos valores distintos
+    (Cargo, Abono, Unidade e as detectadas pela proporção de valores distintos) para category,
+    reduzindo a memória percorrida em cada filtro e contagem
+    """
+    # Idades inteiras (o caso normal) ficam em Int16 nulável, que continua sendo exportado
+    # sem casas decimais no CSV; idades fracionárias ou fora do intervalo ficam em float32
+    if 'Idade' in df.columns:
+        idades = pd.to_numeric(df['Idade'], errors='coerce')
+        validas = idades.dropna()
+        if ((validas % 1 == 0) & (validas.abs() <= np.iinfo(np.int16).max)).all():
+            df['Idade'] = idades.astype('Int16')
+        else:
+            df['Idade'] = idades.astype('float32')
+    
+    # ID numérico vira o menor tipo inteiro possível, desde que a conversão não altere
+    # nenhum valor (por exemplo, IDs com zeros à esquerda continuam como texto)
+    if 'ID' in df.columns:
+        ids = pd.to_numeric(df['ID'], errors='coerce', downcast='integer')
+        if ids.notna().all() and (ids.astype(str) == df['ID'].astype(str)).all():
+            df['ID'] = ids
+    
+    for coluna in ('Cargo', 'Recebe Abono Permanência') + COLUNAS_UNIDADE:
+        if coluna in df.columns:
+            df[coluna] = df[coluna].astype('category')
+    
+    # Demais colunas de texto com valores repetidos (até 5% de valores distintos) também viram category
+    limite_distintos = 0.05 * len(df)
+    for coluna in df.columns:
+        if pd.api.types.is_string_dtype(df[coluna]) and df[coluna].nunique() <= limite_distintos:
+            df[coluna] = df[coluna].astype('category')
+    
+    return df
+
+# Função para detectar a codificação do CSV a partir do início do arquivo
+def _detectar_codificacao(conteudo, tamanho_amostra=4096):
+    """
+    Retorna 'utf-8' quando o trecho a partir do primeiro byte não ASCII (o BOM, se houver) forma
+    UTF-8 válido; caso contrário 'cp1252', a codificação padrão dos arquivos exportados pela SEAP.
+    Apenas tamanho_amostra bytes são decodificados.
+    """
+    nao_ascii = _NAO_ASCII_RE.search(conteudo)
+    if nao_ascii is None:
+        return 'cp1252'  # Arquivo puramente ASCII: qualquer uma das codificações serve
+    
+    amostra = conteudo[nao_ascii.start():nao_ascii.start() + tamanho_amostra]
+    try:
+        # Decodificador incremental: um caractere cortado no fim da amostra não conta como erro
+        codecs.getincrementaldecoder('utf-8')().decode(amostra, final=False)
+    except UnicodeDecodeError:
+        return 'cp1252'
+    return 'utf-8'
+
+# Função para localizar as linhas com menos campos que o cabeçalho
+def _linhas_incompletas(dados, delimitador, n_colunas):
+    """
+    Retorna os índices das linhas de dados (a linha 0 é o cabeçalho) com menos de n_colunas campos,
+    como subtotais. Os delimitadores de todas as linhas são contados de uma vez com NumPy sobre os
+    bytes, sem dividir o arquivo em linhas; linhas vazias também entram no resultado.
+    """
+    buffer = np.frombuffer(dados, dtype=np.uint8)
+    inicios = np.concatenate(([0], np.flatnonzero(buffer == ord('\n')) + 1))
+    inicios = inicios[inicios < len(buffer)]
+    n_delimitadores = np.add.reduceat(buffer == ord(delimitador), inicios, dtype=np.int64)
+    return np.flatnonzero(n_delimitadores < n_colunas - 1)
+
+# Função para remover as linhas que não são registros de militares (totais, vazias)
+def _filtrar_linhas_dados(df):
+    # Remover linhas de totais ou com a primeira coluna vazia
+    primeira_coluna = df.iloc[:, 0].str.strip()
+    df = df[~(primeira_coluna.str.lower().str.startswith('total') | (primeira_coluna == ''))]
+    
+    # Manter apenas linhas com conteúdo real (pelo menos 2 campos não vazios)
+    valores_nao_vazios = (df.apply(lambda coluna: coluna.str.strip()) != '').sum(axis=1)
+    df = df[valores_nao_vazios > 1]
+    
+    # Remover linhas onde o ID está vazio (geralmente linhas de totais ou dummies)
+    if 'ID' in df.columns:
+        df = df[df['ID'].notna() & (df['ID'] != '')]
+    
+    return df
+
+# Função para interpretar os bytes do arquivo CSV (resultado em cache, limitado aos últimos arquivos)
+@st.cache_data(show_spinner="Processando arquivo CSV...", max_entries=4)
+def _ler_bytes_csv(conteudo):
+    """
+    Converte os bytes do arquivo CSV da SEAP em DataFrame, detectando automaticamente o delimitador.
+    Retorna a tupla (df, delimitador); df é None quando o cabeçalho não é encontrado.
+    Não chama funções de interface do Streamlit, para que o resultado possa ficar em cache
+    entre as reexecuções do script (a chave é o próprio conteúdo do arquivo).
+    """
+    # Localizar a linha de cabeçalho diretamente nos bytes (começa com ID e contém Nome, RG),
+    # sem decodificar nem dividir o arquivo inteiro em linhas; o início do cabeçalho não inclui o BOM
+    cabecalho = _HEADER_RE.search(conteudo)
+    if cabecalho is None:
+        return None, None
+    inicio_cabecalho = cabecalho.start('cabecalho')
+    
+    # Determinar o delimitador e o número de colunas a partir do cabeçalho
+    delimitador = cabecalho.group('delimitador').decode()
+    fim_cabecalho = conteudo.find(b'\n', inicio_cabecalho)
+    linha_cabecalho = conteudo[inicio_cabecalho:fim_cabecalho if fim_cabecalho != -1 else len(conteudo)]
+    n_colunas = linha_cabecalho.count(cabecalho.group('delimitador')) + 1
+    
+    # Ler os dados a partir do cabeçalho com o parser em C do pandas, em blocos de linhas
+    # (pula a linha após o header, geralmente vazia, e as linhas com menos campos que o header,
+    # que não são registros; campos extras são ignorados via usecols)
+    # Os bytes a partir do cabeçalho são acessados sem copiar o arquivo: uma memoryview para
+    # a contagem de campos e um BytesIO posicionado no cabeçalho para o read_csv
+    dados = memoryview(conteudo)[inicio_cabecalho:]
+    buf = io.BytesIO(conteudo)
+    linhas_ignoradas = np.union1d([1], _linhas_incompletas(dados, delimitador, n_colunas))
+    opcoes_leitura = dict(
+        sep=delimitador,
+        skiprows=linhas_ignoradas.tolist(),
+        usecols=range(n_colunas),
+        dtype=str,
+        keep_default_na=False,
+        engine='c',
+        chunksize=50_000
+    )
+    # Decodificar uma única vez com a codificação detectada no início do arquivo;
+    # cada bloco é filtrado antes de ser guardado, limitando o pico de memória da leitura
+    codificacao = _detectar_codificacao(conteudo)
+    try:
+        buf.seek(inicio_cabecalho)
+        blocos = [
+            _filtrar_linhas_dados(bloco)
+            for bloco in pd.read_csv(buf, encoding=codificacao, **opcoes_leitura)
+        ]
+    except UnicodeDecodeError:
+        # Fallback para a outra codificação, substituindo bytes inválidos
+        alternativa = 'cp1252' if codificacao.startswith('utf-8') else 'utf-8'
+        buf.seek(inicio_cabecalho)
+        blocos = [
+            _filtrar_linhas_dados(bloco)
+            for bloco in pd.read_csv(buf, encoding=alternativa, encoding_errors='replace', **opcoes_leitura)
+        ]
+    df = pd.concat(blocos, ignore_index=True)
+    
+    # Converter colunas numéricas e categóricas
+    df = _otimizar_tipos(df)
+    
+    return df, delimitador
+
 # Função para processar o arquivo CSV
 def processar_arquivo_csv(uploaded_file):
     """
     Processa o arquivo CSV da SEAP, detectando automaticamente o delimitador
     """
     try:
-        # Leitura inicial do arquivo
-        conteudo = uploaded_file.read()
+        # Ler os bytes do arquivo; o parsing fica em cache enquanto o arquivo não mudar
+        df, delimitador = _ler_bytes_csv(uploaded_file.getvalue())
         
-        # Tentar decodificar com cp1252 (Windows Latin-1)
-        try:
-            texto = conteudo.decode('cp1252')
-        except UnicodeDecodeError:
-            # Fallback para utf-8
-            texto = conteudo.decode('utf-8', errors='replace')
-        
-        # Dividir em linhas
-        linhas = texto.split('\r\n')
-        if len(linhas) <= 1:
-            linhas = texto.split('\n')
-        
-        # Detectar linha de cabeçalho e delimitador
-        indice_header = -1
-        delimitador = ','  # padrão
-        
-        for i, linha in enumerate(linhas):
-            # Procurar por padrão de cabeçalho (começa com ID e contém Nome, RG, CPF)
-            if re.match(r'^ID[,;]Nome[,;]RG', linha):
-                indice_header = i
-                # Determinar o delimitador
-                if ';' in linha:
-                    delimitador = ';'
-                break
-        
-        if indice_header == -1:
+        if df is None:
             st.error("Formato de arquivo inválido. Não foi possível encontrar o cabeçalho com ID, Nome, RG.")
             return None
         
-        # Extrair nomes das colunas
-        colunas = linhas[indice_header].split(delimitador)
-        
-        # Criar lista de dicionários com os dados
-        dados = []
-        for i in range(indice_header + 2, len(linhas)):  # +2 para pular a linha vazia após o header
-            linha = linhas[i].strip()
-            if not linha:  # Pular linhas vazias
-                continue
-            
-            campos = linha.split(delimitador)
-            if len(campos) >= len(colunas):
-                # Criar dicionário com os dados da linha
-                registro = {}
-                for j, coluna in enumerate(colunas):
-                    if j < len(campos):
-                        registro[coluna] = campos[j]
-                
-                # Verificar se não é uma linha de totais
-                primeira_coluna = list(registro.values())[0] if registro else ""
-                if primeira_coluna.lower().startswith("total") or primeira_coluna == "":
-                    continue
-                
-                # Verificar se a linha tem conteúdo real (não só espaços)
-                valores_nao_vazios = [v for v in registro.values() if v.strip()]
-                if len(valores_nao_vazios) > 1:  # Pelo menos 2 campos não vazios
-                    dados.append(registro)
-        
-        # Converter para DataFrame
-        df = pd.DataFrame(dados)
-        
-        # Remover linhas onde todas as colunas são vazias ou NaN
-        df = df.dropna(how='all')
-        
-        # Remover linhas onde o ID está vazio (geralmente linhas de totais ou dummies)
-        if 'ID' in df.columns:
-            df = df[df['ID'].notna() & (df['ID'] != '')]
-        
-        # Converter colunas numéricas
-        if 'Idade' in df.columns:
-            df['Idade'] = pd.to_numeric(df['Idade'], errors='coerce')
-        
         # Informação de debug
         st.success(f"Arquivo processado com sucesso!\n"
                   f"- Delimitador detectado: '{delimitador}'\n"
@@ -248,41 +422,79 @@ def processar_arquivo_csv(uploaded_file):
         st.error(f"Erro ao processar o arquivo: {str(e)}")
         return None
 
+# Função para estimar a densidade (KDE gaussiana) de uma amostra
+def _estimar_kde(valores, grade, max_amostras=5000):
+    """
+    Estima a densidade de probabilidade de valores nos pontos de grade, com kernel gaussiano
+    e largura de banda pela regra de Scott. Amostras maiores que max_amostras são subamostradas.
+    Retorna None quando não há variação suficiente nos dados para a estimativa.
+    """
+    if len(valores) > max_amostras:
+        valores = np.random.default_rng(0).choice(valores, max_amostras, replace=False)
+    
+    if len(valores) < 2:
+        return None
+    
+    largura_banda = valores.std(ddof=1) * len(valores) ** (-1 / 5)
+    if largura_banda == 0:
+        return None
+    
+    # Matriz (pontos da grade x amostras) com as distâncias padronizadas
+    z = (grade[:, np.newaxis] - valores[np.newaxis, :]) / largura_banda
+    return np.exp(-0.5 * z ** 2).sum(axis=1) / (len(valores) * largura_banda * np.sqrt(2 * np.pi))
+
+# Função para calcular média, mediana, mínima e máxima de um vetor de idades (não vazio, sem NaN)
+def calcular_estatisticas_idade(idades):
+    """
+    Mínima, máxima e mediana saem de uma única chamada de np.partition (em vez de três
+    percursos separados); a média é acumulada em float64
+    """
+    n = len(idades)
+    meio = n // 2
+    parcial = np.partition(idades, sorted({0, max(meio - 1, 0), meio, n - 1}))
+    mediana = parcial[meio] if n % 2 else (parcial[meio - 1] + parcial[meio]) / 2
+    return idades.mean(dtype=np.float64), mediana, parcial[0], parcial[-1]
+
 # Função para criar o gráfico de distribuição de idade
-def criar_grafico_distribuicao_idade(df, filtro_abono=None):
-    if 'Idade' not in df.columns:
+def criar_grafico_distribuicao_idade(contexto):
+    if 'Idade' not in contexto.df_filtrado.columns:
         st.error("Coluna de idade não encontrada no arquivo.")
         return None
     
-    # Aplicar filtro de abono se solicitado
-    if filtro_abono is not None and 'Recebe Abono Permanência' in df.columns:
-        df = df[df['Recebe Abono Permanência'] == filtro_abono]
-    
-    # Remover valores nulos
-    df_idade = df.dropna(subset=['Idade'])
+    return _figura_distribuicao_idade(contexto.df_filtrado)
+
+# Função para montar a figura de distribuição de idade
+def _figura_distribuicao_idade(df):
+    # Idades válidas em float32, sem passar por um DataFrame intermediário (dropna)
+    idades = df['Idade'].to_numpy(dtype=np.float32, na_value=np.nan)
+    idades = idades[~np.isnan(idades)]
     
     # Criar figura
-    fig, ax = plt.subplots(figsize=(12, 6))
+    fig, ax = _nova_figura(12, 6)
     
     # Histograma com KDE usando a cor azul escuro do CBMPR
-    sns.histplot(df_idade['Idade'], bins=40, kde=True, ax=ax, color=cores_cbmpr['azul_escuro'])
+    contagens, limites = np.histogram(idades, bins=40)
+    ax.bar(limites[:-1], contagens, width=np.diff(limites), align='edge',
+           color=cores_cbmpr['azul_escuro'], alpha=0.75, edgecolor='white')
+    
+    # Curva KDE na mesma escala do histograma (contagem por classe)
+    grade = np.linspace(limites[0], limites[-1], 200, dtype=np.float32)
+    densidade = _estimar_kde(idades, grade)
+    if densidade is not None:
+        ax.plot(grade, densidade * len(idades) * (limites[1] - limites[0]), color=cores_cbmpr['azul_escuro'])
     
     # Adicionar grade, títulos e ajustes visuais
     ax.grid(alpha=0.3)
     titulo = 'Distribuição de Idade - Corpo de Bombeiros Militar do Paraná'
-    if filtro_abono == 'S':
-        titulo += ' (Com Abono Permanência)'
-    elif filtro_abono == 'N':
-        titulo += ' (Sem Abono Permanência)'
-    ax.set_title(titulo, fontsize=16)
-    ax.set_xlabel('Idade (anos)', fontsize=12)
-    ax.set_ylabel('Frequência', fontsize=12)
+    ax.set_title(titulo)
+    ax.set_xlabel('Idade (anos)')
+    ax.set_ylabel('Frequência')
     
     # Adicionar estatísticas
-    media = df_idade['Idade'].mean()
-    mediana = df_idade['Idade'].median()
-    min_idade = df_idade['Idade'].min()
-    max_idade = df_idade['Idade'].max()
+    if len(idades) > 0:
+        media, mediana, min_idade, max_idade = calcular_estatisticas_idade(idades)
+    else:
+        media = mediana = min_idade = max_idade = np.nan
     
     # Adicionar linhas de média e mediana com cores do CBMPR
     ax.axvline(media, color=cores_cbmpr['vermelho'], linestyle='--', alpha=0.7, label=f'Média: {media:.1f} anos')
@@ -295,103 +507,74 @@ def criar_grafico_distribuicao_idade(df, filtro_abono=None):
                  f"• Mediana: {mediana:.1f} anos\n" \
                  f"• Mínima: {min_idade:.0f} anos\n" \
                  f"• Máxima: {max_idade:.0f} anos\n" \
-                 f"• Total: {len(df_idade)} militares"
+                 f"• Total: {len(idades)} militares"
     
     ax.text(0.02, 0.98, stats_text, transform=ax.transAxes, 
             verticalalignment='top', horizontalalignment='left',
             bbox=dict(boxstyle='round,pad=0.5', facecolor=cores_cbmpr['cinza_claro'], alpha=0.8))
     
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
 
-# Função para criar o gráfico de faixas etárias
-def criar_grafico_faixas_etarias(df, filtro_abono=None):
-    if 'Idade' not in df.columns:
-        return None
-    
-    # Aplicar filtro de abono se solicitado
-    if filtro_abono is not None and 'Recebe Abono Permanência' in df.columns:
-        df = df[df['Recebe Abono Permanência'] == filtro_abono]
-    
-    # Remover valores nulos
-    df_idade = df.dropna(subset=['Idade'])
-    
-    # Definir faixas etárias
-    bins = [18, 25, 30, 35, 40, 45, 50, 55, 60]
-    labels = ['18-25', '26-30', '31-35', '36-40', '41-45', '46-50', '51-55', '56+']
-    
-    # Categorizar idades
-    df_idade['Faixa Etária'] = pd.cut(df_idade['Idade'], bins=bins, labels=labels, right=True)
-    
-    # Contagem por faixa etária
-    contagem = df_idade['Faixa Etária'].value_counts().sort_index()
-    
+# Função para contar as idades em cada faixa etária
+def _contar_faixas_etarias(idades):
+    """
+    Conta as idades por faixa de FAIXAS_ETARIAS_BINS com os mesmos intervalos de pd.cut
+    (fechados à direita), usando busca binária vetorizada e np.bincount sobre códigos inteiros.
+    Idades nulas ou fora das faixas são ignoradas.
+    """
+    n_faixas = len(FAIXAS_ETARIAS_LABELS)
+    codigos = np.searchsorted(FAIXAS_ETARIAS_BINS, idades, side='left') - 1
+    codigos = codigos[(codigos >= 0) & (codigos < n_faixas)]
+    return pd.Series(np.bincount(codigos, minlength=n_faixas), index=FAIXAS_ETARIAS_LABELS)
+
+# Função para montar a figura de faixas etárias a partir da contagem já calculada
+def _figura_faixas_etarias(contagem):
     # Criar figura
-    fig, ax = plt.subplots(figsize=(12, 6))
-    
-    # Definir cores personalizadas para cada barra usando a paleta CBMPR
-    cores_barras = [
-        cores_cbmpr['azul_escuro'],
-        cores_cbmpr['vermelho'],
-        cores_cbmpr['amarelo'],
-        cores_cbmpr['cinza_escuro'],
-        cores_cbmpr['cinza_claro'],
-        cores_cbmpr['preto'],
-        cores_cbmpr['azul_escuro'],
-        cores_cbmpr['vermelho']
-    ]
+    fig, ax = _nova_figura(12, 6)
     
-    # Criar gráfico de barras
-    bars = ax.bar(contagem.index, contagem.values, color=cores_barras[:len(contagem)])
+    # Criar gráfico de barras com uma cor da paleta CBMPR para cada faixa
+    bars = ax.bar(contagem.index, contagem.values, color=CORES_FAIXAS_ETARIAS[:len(contagem)])
     
     # Adicionar títulos e ajustes visuais
     titulo = 'Distribuição por Faixas Etárias - Corpo de Bombeiros Militar do Paraná'
-    if filtro_abono == 'S':
-        titulo += ' (Com Abono Permanência)'
-    elif filtro_abono == 'N':
-        titulo += ' (Sem Abono Permanência)'
-    ax.set_title(titulo, fontsize=16)
-    ax.set_xlabel('Faixa Etária (anos)', fontsize=12)
-    ax.set_ylabel('Quantidade de Militares', fontsize=12)
+    ax.set_title(titulo)
+    ax.set_xlabel('Faixa Etária (anos)')
+    ax.set_ylabel('Quantidade de Militares')
     ax.grid(axis='y', alpha=0.3)
     
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
 
 # Função para criar o gráfico de distribuição por Unidade de Trabalho
-def criar_grafico_distribuicao_unidade(df, filtro_abono=None):
+def criar_grafico_distribuicao_unidade(contexto):
     """
     Cria um gráfico de barras horizontais para visualizar a distribuição de militares por unidade de trabalho
     """
-    # Verificar se a coluna de unidade de trabalho existe
-    if 'Descrição da Unidade de Trabalho' in df.columns:
-        coluna_unidade = 'Descrição da Unidade de Trabalho'
-    elif 'Unidade de Trabalho' in df.columns:
-        coluna_unidade = 'Unidade de Trabalho'
-    elif 'Unidade' in df.columns:
-        coluna_unidade = 'Unidade'
-    else:
+    df = contexto.df_filtrado
+    
+    # Verificar se a coluna de unidade de trabalho existe (detectada após o carregamento)
+    coluna_unidade = st.session_state.get('coluna_unidade')
+    if coluna_unidade is None:
         st.error("Coluna de Unidade de Trabalho não encontrada no arquivo.")
         return None
     
-    # Aplicar filtro de abono se solicitado
-    df_unidade = df.copy()
-    if filtro_abono is not None and 'Recebe Abono Permanência' in df.columns:
-        df_unidade = df_unidade[df_unidade['Recebe Abono Permanência'] == filtro_abono]
-    
-    # Contagem por unidade
-    contagem_unidade = df_unidade[coluna_unidade].value_counts()
+    return _figura_distribuicao_unidade(df, coluna_unidade)
+
+# Função para montar a figura de distribuição por Unidade de Trabalho
+def _figura_distribuicao_unidade(df, coluna_unidade):
+    # Contagem por unidade (apenas as unidades presentes nos dados filtrados)
+    # (sem ordenar todas as unidades: apenas as 20 maiores são selecionadas e ordenadas)
+    contagem_unidade = df[coluna_unidade].value_counts(sort=False)
+    contagem_unidade = contagem_unidade[contagem_unidade > 0]
     
     # Limitar para mostrar apenas as 20 maiores unidades se houver muitas
-    if len(contagem_unidade) > 20:
-        contagem_unidade = contagem_unidade.head(20)
-        titulo_extra = " (20 maiores unidades)"
-    else:
-        titulo_extra = ""
+    titulo_extra = " (20 maiores unidades)" if len(contagem_unidade) > 20 else ""
+    contagem_unidade = contagem_unidade.nlargest(20)
     
     # Criar figura - garantindo espaço suficiente para os nomes das unidades
     altura_grafico = max(10, len(contagem_unidade) * 0.5)  # Ajusta a altura com base no número de unidades
-    fig, ax = plt.subplots(figsize=(14, altura_grafico))
+    fig, ax = _nova_figura(14, altura_grafico)
     
     # Criar um ciclo de cores
     cores_unidades = [
@@ -411,101 +594,169 @@ def criar_grafico_distribuicao_unidade(df, filtro_abono=None):
     
     # Adicionar títulos e ajustes visuais
     titulo = f'Distribuição por Unidade de Trabalho - Corpo de Bombeiros Militar do Paraná{titulo_extra}'
-    if filtro_abono == 'S':
-        titulo += ' (Com Abono Permanência)'
-    elif filtro_abono == 'N':
-        titulo += ' (Sem Abono Permanência)'
-    ax.set_title(titulo, fontsize=16)
-    ax.set_xlabel('Quantidade de Militares', fontsize=12)
-    ax.set_ylabel('Unidade de Trabalho', fontsize=12)
+    ax.set_title(titulo)
+    ax.set_xlabel('Quantidade de Militares')
+    ax.set_ylabel('Unidade de Trabalho')
     
     # Adicionar grade apenas no eixo x
     ax.grid(axis='x', alpha=0.3)
     ax.set_axisbelow(True)
     
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
 
-# Função para criar o gráfico de distribuição por Cargo (Posto/Graduação)
-def criar_grafico_distribuicao_cargo(df, filtro_abono=None):
-    if 'Cargo' not in df.columns:
-        st.error("Coluna de Cargo (Posto/Graduação) não encontrada no arquivo.")
-        return None
-    
-    # Aplicar filtro de abono se solicitado
-    if filtro_abono is not None and 'Recebe Abono Permanência' in df.columns:
-        df = df[df['Recebe Abono Permanência'] == filtro_abono]
-    
-    # Limpar e padronizar valores da coluna Cargo
-    df_cargo = df.copy()
-    
-    # Contagem por cargo
-    contagem_cargo = df_cargo['Cargo'].value_counts()
-    
-    # Ordenar os cargos conforme hierarquia militar específica (ordem correta com Coronel no topo)
-    hierarquia = [
-        'Soldado 2ª Classe', 'Soldado 1ª Classe', 'Cabo', '3º Sargento', '2º Sargento', '1º Sargento',
-        'Subtenente', 'Aluno de 1º Ano', 'Aluno de 2º Ano', 'Aluno de 3º Ano', 'Aspirante a Oficial',
-        '2º Tenente 6', '2º Tenente', '1º Tenente', 'Capitão', 'Major', 'Tenente Coronel', 'Coronel'
-    ]
-    
-    # Filtrar e reordenar os cargos encontrados conforme a hierarquia
-    ordem_personalizada = []
-    for rank in hierarquia:
-        for cargo in contagem_cargo.index:
-            if rank in cargo:
-                ordem_personalizada.append(cargo)
-    
-    # Adicionar quaisquer outros cargos que não se encaixam na hierarquia padrão
-    for cargo in contagem_cargo.index:
-        if cargo not in ordem_personalizada:
-            ordem_personalizada.append(cargo)
-    
-    # Filtrar para manter apenas os cargos que existem no DataFrame
-    ordem_final = [cargo for cargo in ordem_personalizada if cargo in contagem_cargo.index]
-    
-    # Reordenar a contagem
-    contagem_cargo = contagem_cargo.reindex(ordem_final)
+# Função para calcular a posição de cada categoria de Cargo na hierarquia militar (resultado em cache)
+@st.cache_data(show_spinner=False, max_entries=32)
+def _posicoes_hierarquia(categorias):
+    """
+    Recebe a tupla de categorias da coluna Cargo e retorna, na mesma ordem, a posição do primeiro
+    posto da HIERARQUIA contido em cada nome; cargos fora da hierarquia padrão ficam no final.
+    A chave é a mesma para a aba de filtro e para os gráficos do mesmo arquivo e persiste entre
+    reexecuções do script
+    """
+    return np.array([
+        next((i for i, rank in enumerate(HIERARQUIA) if rank in cargo), len(HIERARQUIA))
+        for cargo in categorias
+    ])
+
+# Função para ordenar cargos categóricos conforme a hierarquia militar
+def _ordenar_cargos(cargos):
+    """
+    Recebe um Categorical ou CategoricalIndex de cargos e retorna as posições que os ordenam
+    do menor posto/graduação para o maior (Coronel no topo dos gráficos de barras horizontais).
+    A ordenação é estável, então empates mantêm a ordem de entrada.
+    """
+    posicoes = _posicoes_hierarquia(tuple(cargos.categories))
+    return np.argsort(posicoes[cargos.codes], kind='stable')
+
+# Função para ordenar a contagem por cargo conforme a hierarquia militar
+def _ordenar_por_hierarquia(contagem_cargo):
+    # Cargos com o mesmo posto mantêm a ordem por quantidade
+    return contagem_cargo.iloc[_ordenar_cargos(contagem_cargo.index)]
+
+# Função para montar a figura de distribuição por Cargo a partir da contagem já calculada
+def _figura_distribuicao_cargo(contagem_cargo):
+    contagem_cargo = _ordenar_por_hierarquia(contagem_cargo)
     
     # Criar figura - garantindo espaço suficiente para os nomes dos cargos
-    fig, ax = plt.subplots(figsize=(14, 10))
-    
-    # Definir cores personalizadas sem usar branco
-    # Azul escuro, vermelho, amarelo, cinza escuro, cinza claro, verde, preto
-    cores_cbmpr = ['#062733', '#D34339', '#FFD928', '#606062', '#A39B96', '#2E8B57', '#373435']
-    
-    # Criar um mapeamento de cores para cada posto/graduação
-    n_cargos = len(contagem_cargo)
-    cores_mapeadas = []
-    
-    # Distribuir as cores entre os cargos, repetindo se necessário
-    for i in range(n_cargos):
-        cor_idx = i % len(cores_cbmpr)
-        cores_mapeadas.append(cores_cbmpr[cor_idx])
+    fig, ax = _nova_figura(14, 10)
     
-    # Criar gráfico de barras horizontais com as cores personalizadas
+    # Criar gráfico de barras horizontais com as cores personalizadas, repetidas em ciclo
+    cores_mapeadas = [CORES_CARGOS[i % len(CORES_CARGOS)] for i in range(len(contagem_cargo))]
     bars = ax.barh(contagem_cargo.index, contagem_cargo.values, color=cores_mapeadas)
     
     # Adicionar títulos e ajustes visuais
     titulo = 'Distribuição por Posto/Graduação - Corpo de Bombeiros Militar do Paraná'
-    if filtro_abono == 'S':
-        titulo += ' (Com Abono Permanência)'
-    elif filtro_abono == 'N':
-        titulo += ' (Sem Abono Permanência)'
-    ax.set_title(titulo, fontsize=16)
-    ax.set_xlabel('Quantidade de Militares', fontsize=12)
-    ax.set_ylabel('Posto/Graduação', fontsize=12)
+    ax.set_title(titulo)
+    ax.set_xlabel('Quantidade de Militares')
+    ax.set_ylabel('Posto/Graduação')
     
     # Adicionar grade apenas no eixo x
     ax.grid(axis='x', alpha=0.3)
     ax.set_axisbelow(True)
     
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
 
-# Interface principal do Streamlit
-st.markdown(
-    f"""
+# Função para renderizar o gráfico de faixas etárias em PNG (resultado em cache)
+@st.cache_data(show_spinner=False, max_entries=16)
+def png_grafico_faixas_etarias(contagem, dpi):
+    """
+    Apenas os bytes do PNG ficam em cache (compartilhado entre sessões): cada PNG é gerado
+    a partir de uma figura nova, sem figuras Matplotlib vivas compartilhadas entre threads
+    """
+    return renderizar_png(_figura_faixas_etarias(contagem), dpi)
+
+# Função para renderizar o gráfico de distribuição por Cargo em PNG (resultado em cache)
+@st.cache_data(show_spinner=False, max_entries=16)
+def png_grafico_distribuicao_cargo(contagem_cargo, dpi):
+    return renderizar_png(_figura_distribuicao_cargo(contagem_cargo), dpi)
+
+# Função para oferecer o download de um gráfico em PNG, gerado apenas quando solicitado
+def oferecer_download_png(gerar_png, contagem, dpi, nome_arquivo):
+    """
+    Rasterizar a figura Matplotlib é bem mais lento que exibir o gráfico Plotly da tela, então o
+    PNG só é gerado depois do clique em 'Gerar PNG'. O pedido fica em st.session_state junto com
+    a contagem e o dpi; se os filtros ou a resolução mudarem, o PNG precisa ser pedido de novo
+    """
+    pedido = st.session_state.get('png_solicitado')
+    if pedido is not None and pedido[:2] == (nome_arquivo, dpi) and pedido[2].equals(contagem):
+        st.download_button(
+            label="📥 Download do Gráfico (PNG)",
+            data=gerar_png(contagem, dpi),
+            file_name=nome_arquivo,
+            mime="image/png"
+        )
+    else:
+        # Registrar o pedido antes da reexecução disparada pelo clique
+        def solicitar_png():
+            st.session_state.png_solicitado = (nome_arquivo, dpi, contagem)
+        
+        st.button("🖼️ Gerar PNG do Gráfico", on_click=solicitar_png, key=f"gerar_{nome_arquivo}")
+
+# Função para montar o HTML do card com o efetivo total
+def html_card_efetivo(total, estilo_fundo, estilo_titulo=""):
+    return f"""
+    <div style="
+        {estilo_fundo}
+        padding: 20px;
+        border-radius: 10px;
+        text-align: center;
+        margin: 20px 0;
+        box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
+    ">
+        <h2 style="color: white; margin: 0;{estilo_titulo}">Efetivo Total</h2>
+        <h1 style="color: white; font-size: 48px; margin: 10px 0;">{total}</h1>
+        <p style="color: white; margin: 0;">militares</p>
+    </div>
+    """
+
+# Função para montar o HTML do cabeçalho colorido de uma seção ou bloco de estatísticas
+def _html_cabecalho(titulo, cor_fundo, tag="h2", cor_titulo="white", tamanho="1.5em", margem_superior="30px"):
+    margem = f"\n        margin-top: {margem_superior};" if margem_superior else ""
+    return f"""
+    <div style="
+        background-color: {cor_fundo};
+        padding: 12px 20px;
+        border-radius: 8px 8px 0 0;{margem}
+        margin-bottom: 0px;
+    ">
+        <{tag} style="color: {cor_titulo}; margin: 0; font-size: {tamanho};">{titulo}</{tag}>
+    </div>
+    """
+
+# Função para montar o HTML do fundo claro abaixo do cabeçalho de uma seção
+def _html_fundo(espacamento, margem_inferior):
+    return f"""
+    <div style="
+        background-color: {cores_cbmpr['cinza_claro']}20;
+        padding: {espacamento};
+        border-radius: 0 0 8px 8px;
+        margin-bottom: {margem_inferior};
+        border: 1px solid {cores_cbmpr['cinza_claro']}60;
+    ">
+    </div>
+    """
+
+# HTML fixo dos cabeçalhos e fundos das seções, montado uma única vez na importação
+HTML_CABECALHO_CARREGAR = _html_cabecalho("1. Carregar Arquivo", cores_cbmpr['azul_escuro'])
+HTML_CABECALHO_FILTROS = _html_cabecalho("2. Filtros", cores_cbmpr['azul_escuro'])
+HTML_CABECALHO_VISUALIZACOES = _html_cabecalho("3. Visualizações", cores_cbmpr['azul_escuro'])
+HTML_CABECALHO_ESTATISTICAS = _html_cabecalho(
+    "Estatísticas com base nos filtros aplicados", cores_cbmpr['amarelo'],
+    tag="h3", cor_titulo=cores_cbmpr['preto'], tamanho="1.3em", margem_superior=None
+)
+HTML_CABECALHO_IDADE = _html_cabecalho(
+    "Estatísticas de Idade", cores_cbmpr['vermelho'], tag="h3", tamanho="1.3em", margem_superior="20px"
+)
+HTML_CABECALHO_ABONO = _html_cabecalho(
+    "Estatísticas de Abono Permanência", cores_cbmpr['cinza_escuro'], tag="h3", tamanho="1.3em", margem_superior="20px"
+)
+HTML_FUNDO_CARREGAR = _html_fundo("20px", "30px")
+HTML_FUNDO_SECAO = _html_fundo("10px 20px", "20px")
+
+# HTML fixo do banner de título e do bloco de apresentação com os formatos suportados
+HTML_BANNER = f"""
     <div style="
         background: linear-gradient(135deg, {cores_cbmpr['azul_escuro']} 0%, {cores_cbmpr['vermelho']} 100%);
         padding: 20px;
@@ -515,18 +766,9 @@ st.markdown(
     ">
         <h1 style="color: white; text-align: center; margin: 0;">🚒 Dashboard - Pessoal CBMPR</h1>
     </div>
-    """,
-    unsafe_allow_html=True
-)
-
-# Inicializar session_state para gerenciar o estado da aplicação
-if 'filtros_cargo' not in st.session_state:
-    st.session_state.filtros_cargo = []
-if 'filtros_unidade' not in st.session_state:
-    st.session_state.filtros_unidade = []
+    """
 
-st.markdown(
-    f"""
+HTML_INTRODUCAO = f"""
     <div style="
         background-color: {cores_cbmpr['cinza_claro']}30;
         padding: 15px;
@@ -566,58 +808,94 @@ st.markdown(
             <strong>📄 Formato suportado:</strong> CSV com delimitador ponto-e-vírgula (;)
         </div>
     </div>
-    """,
-    unsafe_allow_html=True
-)
+    """
 
-# Seção de upload de arquivo
-st.markdown(
-    f"""
+# HTML fixo do rodapé
+HTML_RODAPE = f"""
     <div style="
-        background-color: {cores_cbmpr['azul_escuro']};
-        padding: 12px 20px;
-        border-radius: 8px 8px 0 0;
-        margin-top: 30px;
-        margin-bottom: 0px;
+        background: linear-gradient(135deg, {cores_cbmpr['cinza_escuro']} 0%, {cores_cbmpr['azul_escuro']} 100%);
+        padding: 25px;
+        border-radius: 10px;
+        color: white;
+        text-align: center;
+        margin-top: 40px;
+        box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
     ">
-        <h2 style="color: white; margin: 0; font-size: 1.5em;">1. Carregar Arquivo</h2>
+        <p style="margin-bottom: 10px;"><strong>Dashboard desenvolvido para o Corpo de Bombeiros Militar do Paraná</strong></p>
+        <p style="margin: 0;">💻 Para mais informações, consulte o repositório no GitHub</p>
+        <div style="font-size: 30px; margin-top: 10px;">
+            <span style="margin: 0 10px; color: {cores_cbmpr['amarelo']};">🚒</span>
+            <span style="margin: 0 10px; color: {cores_cbmpr['vermelho']};">🔥</span>
+            <span style="margin: 0 10px; color: {cores_cbmpr['amarelo']};">🚒</span>
+        </div>
     </div>
-    """,
-    unsafe_allow_html=True
-)
+    """
 
-# Adicionar um fundo claro para a seção de upload
-st.markdown(
-    f"""
-    <div style="
-        background-color: {cores_cbmpr['cinza_claro']}20;
-        padding: 20px;
-        border-radius: 0 0 8px 8px;
-        margin-bottom: 30px;
-        border: 1px solid {cores_cbmpr['cinza_claro']}60;
-    ">
-    </div>
-    """,
-    unsafe_allow_html=True
-)
+# Função para criar o gráfico interativo (Plotly) de faixas etárias
+def criar_grafico_interativo_faixas_etarias(contexto):
+    if contexto.contagem_faixa is None:
+        return None
+    
+    return _figura_interativa_faixas_etarias(contexto.contagem_faixa)
 
-# Opção para usar dados simulados para teste
-usar_dados_teste = st.checkbox("Usar dados de exemplo para teste", value=False)
+# Função para montar o gráfico interativo de faixas etárias (resultado em cache)
+@st.cache_resource(max_entries=16)
+def _figura_interativa_faixas_etarias(contagem):
+    """
+    O gráfico é desenhado no navegador a partir de uma especificação JSON pequena,
+    sem rasterizar uma imagem no servidor a cada reexecução
+    """
+    fig = px.bar(
+        x=list(contagem.index),
+        y=contagem.values,
+        title='Distribuição por Faixas Etárias - Corpo de Bombeiros Militar do Paraná',
+        labels={'x': 'Faixa Etária (anos)', 'y': 'Quantidade de Militares'}
+    )
+    fig.update_traces(marker_color=CORES_FAIXAS_ETARIAS[:len(contagem)])
+    return fig
 
-if usar_dados_teste:
-    # Criar dados de exemplo com distribuição similar à encontrada na análise
-    np.random.seed(42)  # Para reprodutibilidade
+# Função para criar o gráfico interativo (Plotly) de distribuição por Cargo
+def criar_grafico_interativo_cargo(contexto):
+    if contexto.contagem_cargo is None:
+        return None
     
-    # Distribuição aproximada de idade
+    return _figura_interativa_cargo(contexto.contagem_cargo)
+
+# Função para montar o gráfico interativo de distribuição por Cargo (resultado em cache)
+@st.cache_resource(max_entries=16)
+def _figura_interativa_cargo(contagem_cargo):
+    contagem_cargo = _ordenar_por_hierarquia(contagem_cargo)
+    
+    fig = px.bar(
+        x=contagem_cargo.values,
+        y=[str(cargo) for cargo in contagem_cargo.index],
+        orientation='h',
+        title='Distribuição por Posto/Graduação - Corpo de Bombeiros Militar do Paraná',
+        labels={'x': 'Quantidade de Militares', 'y': 'Posto/Graduação'},
+        height=max(500, len(contagem_cargo) * 35)
+    )
+    cores_mapeadas = [CORES_CARGOS[i % len(CORES_CARGOS)] for i in range(len(contagem_cargo))]
+    fig.update_traces(marker_color=cores_mapeadas)
+    return fig
+
+# Função para gerar os dados de exemplo (resultado em cache por semente)
+@st.cache_data(show_spinner=False)
+def gerar_dados_exemplo(seed=42):
+    """
+    Gera um DataFrame simulado com distribuição similar à dos dados reais do CBMPR
+    """
+    rng = np.random.default_rng(seed)  # Para reprodutibilidade
+    
+    # Distribuição aproximada de idade: (idade mínima, idade máxima exclusiva) -> quantidade
     faixas = {
-        "18-25": 138,
-        "26-30": 264,
-        "31-35": 762,
-        "36-40": 876,
-        "41-45": 568,
-        "46-50": 363,
-        "51-55": 231,
-        "56+": 9
+        (18, 26): 138,  # 18-25
+        (26, 31): 264,  # 26-30
+        (31, 36): 762,  # 31-35
+        (36, 41): 876,  # 36-40
+        (41, 46): 568,  # 41-45
+        (46, 51): 363,  # 46-50
+        (51, 56): 231,  # 51-55
+        (56, 61): 9     # 56+
     }
     
     # Distribuição aproximada de cargos
@@ -637,55 +915,121 @@ if usar_dados_teste:
         "Soldado 2ª Classe": 50
     }
     
-    # Gerar idades com base na distribuição
-    idades = []
-    for faixa, quantidade in faixas.items():
-        if faixa == "18-25":
-            idades.extend(np.random.randint(18, 26, quantidade))
-        elif faixa == "26-30":
-            idades.extend(np.random.randint(26, 31, quantidade))
-        elif faixa == "31-35":
-            idades.extend(np.random.randint(31, 36, quantidade))
-        elif faixa == "36-40":
-            idades.extend(np.random.randint(36, 41, quantidade))
-        elif faixa == "41-45":
-            idades.extend(np.random.randint(41, 46, quantidade))
-        elif faixa == "46-50":
-            idades.extend(np.random.randint(46, 51, quantidade))
-        elif faixa == "51-55":
-            idades.extend(np.random.randint(51, 56, quantidade))
-        elif faixa == "56+":
-            idades.extend(np.random.randint(56, 61, quantidade))
+    # Gerar idades com base na distribuição (um sorteio vetorizado por faixa)
+    idades = np.concatenate([
+        rng.integers(inicio, fim, quantidade) for (inicio, fim), quantidade in faixas.items()
+    ])
     
     # Gerar lista de cargos
-    lista_cargos = []
-    for cargo, quantidade in cargos.items():
-        lista_cargos.extend([cargo] * quantidade)
+    lista_cargos = np.repeat(list(cargos.keys()), list(cargos.values()))
     
     # Ajustar tamanhos se necessário
     min_len = min(len(idades), len(lista_cargos))
     idades = idades[:min_len]
     lista_cargos = lista_cargos[:min_len]
     
-    # Gerar valores para Abono Permanência (mais comuns para idade > 50)
-    recebe_abono = []
-    for idade in idades:
-        if idade >= 50:
-            # 80% das pessoas com 50+ anos recebem abono
-            recebe_abono.append('S' if np.random.random() < 0.8 else 'N')
-        else:
-            # 5% das pessoas abaixo de 50 anos recebem abono
-            recebe_abono.append('S' if np.random.random() < 0.05 else 'N')
+    # Gerar valores para Abono Permanência (mais comuns para idade > 50):
+    # 80% das pessoas com 50+ anos recebem abono, contra 5% das pessoas abaixo de 50 anos
+    probabilidade_abono = np.where(idades >= 50, 0.8, 0.05)
+    recebe_abono = np.where(rng.random(min_len) < probabilidade_abono, 'S', 'N')
     
     # Criar dataframe de exemplo
-    df = pd.DataFrame({
+    return _otimizar_tipos(pd.DataFrame({
         'ID': range(1, min_len + 1),
         'Nome': [f'Bombeiro Exemplo {i}' for i in range(1, min_len + 1)],
         'Idade': idades,
         'Cargo': lista_cargos,
         'Recebe Abono Permanência': recebe_abono
+    }))
+
+# Função para montar a tabela de distribuição (quantidade e percentual) a partir de uma contagem
+def montar_tabela_distribuicao(contagem, nome_coluna):
+    # Percentual calculado direto no vetor de contagens (NaN quando o total é zero)
+    valores = contagem.to_numpy()
+    with np.errstate(invalid='ignore'):
+        percentual = np.round(valores / valores.sum() * 100, 2)
+    
+    return pd.DataFrame({
+        nome_coluna: contagem.index,
+        'Quantidade': valores,
+        'Percentual (%)': percentual
     })
 
+# Dados filtrados e agregações de uma combinação de dados + filtros, reaproveitados entre reexecuções
+@dataclass
+class ContextoDashboard:
+    df_filtrado: pd.DataFrame
+    contagem_cargo: pd.Series = None  # None quando a coluna não existe no arquivo
+    contagem_faixa: pd.Series = None
+    tabela_cargos: pd.DataFrame = None  # Tabelas de quantidade e percentual exibidas e baixadas
+    tabela_faixas: pd.DataFrame = None
+    totais_abono: tuple = None  # (total, recebem, não recebem)
+
+# Função para obter o contexto dos dados filtrados (em cache na sessão)
+def obter_contexto(df, chave_dados, filtro_abono, filtros_cargo, filtros_unidade):
+    """
+    Retorna o ContextoDashboard com o DataFrame filtrado e as agregações usadas nas
+    estatísticas, gráficos e tabelas. O contexto fica guardado em st.session_state sob a
+    chave (dados + filtros aplicados), de modo que reexecuções com os mesmos filtros não
+    filtram nem percorrem o DataFrame novamente. Como cada contexto guarda um df_filtrado,
+    apenas os 4 contextos usados mais recentemente são mantidos.
+    """
+    cache = st.session_state.setdefault('cache_contextos', {})
+    chave = (chave_dados, filtro_abono, tuple(filtros_cargo), tuple(filtros_unidade))
+    
+    if chave in cache:
+        # Reinserir no fim do dicionário, que fica ordenado do uso mais antigo ao mais recente
+        cache[chave] = cache.pop(chave)
+    else:
+        # Descartar o contexto usado há mais tempo
+        if len(cache) >= 4:
+            del cache[next(iter(cache))]
+        
+        df_filtrado = aplicar_filtros(df, filtro_abono, filtros_cargo, filtros_unidade)
+        contexto = ContextoDashboard(df_filtrado)
+        if 'Cargo' in df_filtrado.columns:
+            contagem_cargo = df_filtrado['Cargo'].value_counts()
+            contexto.contagem_cargo = contagem_cargo[contagem_cargo > 0]
+            contexto.tabela_cargos = montar_tabela_distribuicao(contexto.contagem_cargo, 'Posto/Graduação')
+        if 'Idade' in df_filtrado.columns:
+            idades = df_filtrado['Idade'].to_numpy(dtype=np.float32, na_value=np.nan)
+            contexto.contagem_faixa = _contar_faixas_etarias(idades)
+            contexto.tabela_faixas = montar_tabela_distribuicao(contexto.contagem_faixa, 'Faixa Etária')
+        if 'Recebe Abono Permanência' in df_filtrado.columns:
+            # Uma única contagem (sobre os códigos da coluna category) em vez de uma comparação por valor
+            contagem_abono = df_filtrado['Recebe Abono Permanência'].value_counts()
+            contexto.totais_abono = (
+                len(df_filtrado), int(contagem_abono.get('S', 0)), int(contagem_abono.get('N', 0))
+            )
+        cache[chave] = contexto
+    
+    return cache[chave]
+
+# Interface principal do Streamlit
+st.markdown(HTML_BANNER, unsafe_allow_html=True)
+
+# Inicializar session_state para gerenciar o estado da aplicação
+if 'filtros_cargo' not in st.session_state:
+    st.session_state.filtros_cargo = []
+if 'filtros_unidade' not in st.session_state:
+    st.session_state.filtros_unidade = []
+
+st.markdown(HTML_INTRODUCAO, unsafe_allow_html=True)
+
+# Seção de upload de arquivo
+st.markdown(HTML_CABECALHO_CARREGAR, unsafe_allow_html=True)
+
+# Adicionar um fundo claro para a seção de upload
+st.markdown(HTML_FUNDO_CARREGAR, unsafe_allow_html=True)
+
+# Opção para usar dados simulados para teste
+usar_dados_teste = st.checkbox("Usar dados de exemplo para teste", value=False)
+
+if usar_dados_teste:
+    # Criar dados de exemplo com distribuição similar à encontrada na análise
+    df = gerar_dados_exemplo(42)
+    chave_dados = 'exemplo'
+
 # Remover a seção de "Ver amostra dos dados" que aparece logo após o upload
 # E adicionar filtro de dados
 if usar_dados_teste:
@@ -694,20 +1038,11 @@ if usar_dados_teste:
     
     # Card destacado com o efetivo total
     st.markdown(
-        f"""
-        <div style="
-            background: linear-gradient(135deg, {cores_cbmpr['vermelho']} 0%, {cores_cbmpr['azul_escuro']} 100%);
-            padding: 20px;
-            border-radius: 10px;
-            text-align: center;
-            margin: 20px 0;
-            box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
-        ">
-            <h2 style="color: white; margin: 0; font-weight: 400;">Efetivo Total</h2>
-            <h1 style="color: white; font-size: 48px; margin: 10px 0;">{len(df)}</h1>
-            <p style="color: white; margin: 0;">militares</p>
-        </div>
-        """,
+        html_card_efetivo(
+            len(df),
+            f"background: linear-gradient(135deg, {cores_cbmpr['vermelho']} 0%, {cores_cbmpr['azul_escuro']} 100%);",
+            " font-weight: 400;"
+        ),
         unsafe_allow_html=True
     )
     
@@ -716,26 +1051,20 @@ else:
     uploaded_file = st.file_uploader("Escolha o arquivo CSV", type="csv")
     
     if uploaded_file is not None:
+        # Descartar os contextos filtrados do arquivo anterior (nesta sessão) quando um novo
+        # arquivo é carregado; os caches de gráficos têm chave no conteúdo e não são limpos
+        if st.session_state.get('token_arquivo') != uploaded_file.file_id:
+            st.session_state.pop('cache_contextos', None)
+            st.session_state.token_arquivo = uploaded_file.file_id
+        
         try:
             df = processar_arquivo_csv(uploaded_file)
+            chave_dados = uploaded_file.file_id
             
             if df is not None:
                 # Card destacado com o efetivo total
                 st.markdown(
-                    f"""
-                    <div style="
-                        background-color: {cores_cbmpr['vermelho']};
-                        padding: 20px;
-                        border-radius: 10px;
-                        text-align: center;
-                        margin: 20px 0;
-                        box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
-                    ">
-                        <h2 style="color: white; margin: 0;">Efetivo Total</h2>
-                        <h1 style="color: white; font-size: 48px; margin: 10px 0;">{len(df)}</h1>
-                        <p style="color: white; margin: 0;">militares</p>
-                    </div>
-                    """,
+                    html_card_efetivo(len(df), f"background-color: {cores_cbmpr['vermelho']};"),
                     unsafe_allow_html=True
                 )
             else:
@@ -748,36 +1077,17 @@ else:
         st.info("Por favor, faça upload de um arquivo CSV ou use os dados de exemplo.")
         st.stop()
 
+# Detectar a coluna de unidade uma única vez por conjunto de dados carregado;
+# filtros, gráficos e tabelas leem o resultado de st.session_state.coluna_unidade
+if st.session_state.get('chave_coluna_unidade') != chave_dados:
+    st.session_state.coluna_unidade = obter_coluna_unidade(df)
+    st.session_state.chave_coluna_unidade = chave_dados
+
 # Seção de Filtros
-st.markdown(
-    f"""
-    <div style="
-        background-color: {cores_cbmpr['azul_escuro']};
-        padding: 12px 20px;
-        border-radius: 8px 8px 0 0;
-        margin-top: 30px;
-        margin-bottom: 0px;
-    ">
-        <h2 style="color: white; margin: 0; font-size: 1.5em;">2. Filtros</h2>
-    </div>
-    """,
-    unsafe_allow_html=True
-)
+st.markdown(HTML_CABECALHO_FILTROS, unsafe_allow_html=True)
 
 # Adicionar um fundo claro para a seção de filtros
-st.markdown(
-    f"""
-    <div style="
-        background-color: {cores_cbmpr['cinza_claro']}20;
-        padding: 10px 20px;
-        border-radius: 0 0 8px 8px;
-        margin-bottom: 20px;
-        border: 1px solid {cores_cbmpr['cinza_claro']}60;
-    ">
-    </div>
-    """,
-    unsafe_allow_html=True
-)
+st.markdown(HTML_FUNDO_SECAO, unsafe_allow_html=True)
 
 # Inicializar variáveis de filtro
 filtros_cargo = []
@@ -786,29 +1096,30 @@ filtros_unidade = []
 # Aplicar função de filtragem
 def aplicar_filtros(dataframe, filtro_abono, filtros_cargo, filtros_unidade=None):
     """Aplica todos os filtros selecionados ao dataframe"""
-    df_filtrado = dataframe.copy()
+    # Os filtros são combinados em uma única máscara booleana, aplicada uma só vez ao final
+    mascara = np.ones(len(dataframe), dtype=bool)
     
     # Aplicar filtro de abono, se houver
     if filtro_abono is not None and 'Recebe Abono Permanência' in dataframe.columns:
-        df_filtrado = df_filtrado[df_filtrado['Recebe Abono Permanência'] == filtro_abono]
+        mascara &= (dataframe['Recebe Abono Permanência'] == filtro_abono).to_numpy()
     
     # Aplicar filtro de cargos, se houver
     if filtros_cargo and 'Cargo' in dataframe.columns:
-        df_filtrado = df_filtrado[df_filtrado['Cargo'].isin(filtros_cargo)]
+        mascara &= dataframe['Cargo'].isin(filtros_cargo).to_numpy()
     
     # Aplicar filtro de unidades, se houver
     if filtros_unidade:
-        # Verificar qual coluna de unidade existe
-        coluna_unidade = None
-        for possivel_coluna in ['Descrição da Unidade de Trabalho', 'Unidade de Trabalho', 'Unidade']:
-            if possivel_coluna in dataframe.columns:
-                coluna_unidade = possivel_coluna
-                break
+        # Coluna de unidade detectada após o carregamento dos dados
+        coluna_unidade = st.session_state.get('coluna_unidade')
         
-        if coluna_unidade and filtros_unidade:
-            df_filtrado = df_filtrado[df_filtrado[coluna_unidade].isin(filtros_unidade)]
+        if coluna_unidade:
+            mascara &= dataframe[coluna_unidade].isin(filtros_unidade).to_numpy()
+    
+    # Sem nenhuma linha removida, usar o próprio dataframe em vez de uma cópia completa
+    if mascara.all():
+        return dataframe
     
-    return df_filtrado
+    return dataframe[mascara]
 
 # Criar tabs para os diferentes tipos de filtros
 tab_cargo, tab_unidade, tab_abono = st.tabs(["Filtro por Posto/Graduação", "Filtro por Unidade", "Filtro por Abono"])
@@ -835,35 +1146,23 @@ with tab_abono:
 # Tab 2: Filtro por Posto/Graduação
 with tab_cargo:
     if 'Cargo' in df.columns:
-        # Obter lista única de postos/graduações
-        cargos = df['Cargo'].unique()
-        
-        # Ordenar os cargos conforme hierarquia militar específica (com Coronel no topo)
-        hierarquia = [
-            'Soldado 2ª Classe', 'Soldado 1ª Classe', 'Cabo', '3º Sargento', '2º Sargento', '1º Sargento',
-            'Subtenente', 'Aluno de 1º Ano', 'Aluno de 2º Ano', 'Aluno de 3º Ano', 'Aspirante a Oficial',
-            '2º Tenente 6', '2º Tenente', '1º Tenente', 'Capitão', 'Major', 'Tenente Coronel', 'Coronel'
-        ]
-        
-        # Ordenar cargos conforme hierarquia
-        cargos_ordenados = []
-        for rank in hierarquia:
-            for cargo in cargos:
-                if rank in cargo and cargo not in cargos_ordenados:
-                    cargos_ordenados.append(cargo)
-        
-        # Adicionar quaisquer outros cargos que não se encaixam na hierarquia padrão
-        for cargo in cargos:
-            if cargo not in cargos_ordenados:
-                cargos_ordenados.append(cargo)
+        # Obter lista única de postos/graduações e ordenar conforme hierarquia militar específica
+        # (com Coronel no topo); quaisquer outros cargos que não se encaixam na hierarquia padrão
+        # ficam no final. A lista só muda quando outro conjunto de dados é carregado, então fica
+        # em st.session_state e é reaproveitada nas reexecuções seguintes
+        if st.session_state.get('chave_cargos_ordenados') != chave_dados:
+            cargos = df['Cargo'].unique()
+            st.session_state.cargos_ordenados = list(cargos[_ordenar_cargos(cargos)])
+            st.session_state.chave_cargos_ordenados = chave_dados
+        cargos_ordenados = st.session_state.cargos_ordenados
         
         # Inicializar o estado dos filtros de cargo se ainda não existir
         if 'filtros_cargo' not in st.session_state:
-            st.session_state.filtros_cargo = cargos_ordenados.copy()
+            st.session_state.filtros_cargo = list(cargos_ordenados)
         
         # Função para selecionar todos os cargos
         def selecionar_todos_cargos():
-            st.session_state.filtros_cargo = cargos_ordenados.copy()
+            st.session_state.filtros_cargo = list(cargos_ordenados)
         
         # Função para limpar todos os cargos
         def limpar_cargos():
@@ -889,8 +1188,21 @@ with tab_cargo:
             )
             # Atualizar o estado com a seleção atual
             st.session_state.filtros_cargo = filtros_cargo
+        elif hasattr(st, 'pills'):
+            # Para poucos cargos, usar um único widget de seleção múltipla (st.pills, Streamlit >= 1.40)
+            # em vez de um checkbox por cargo; a seleção salva pode ter cargos de um arquivo anterior,
+            # que não fazem parte das opções atuais (st.pills rejeita um default fora das opções)
+            filtros_cargo = st.pills(
+                "Selecione os Postos/Graduações:",
+                options=cargos_ordenados,
+                default=[cargo for cargo in st.session_state.filtros_cargo if cargo in cargos_ordenados],
+                selection_mode="multi",
+                key="pills_cargos"
+            )
+            # Atualizar o estado com a seleção atual
+            st.session_state.filtros_cargo = filtros_cargo
         else:
-            # Para poucos cargos, usar checkboxes
+            # Para poucos cargos, usar checkboxes (versões do Streamlit sem st.pills)
             st.write("Selecione os Postos/Graduações:")
             filtros_cargo = []
             # Organizar em 2 colunas
@@ -911,12 +1223,8 @@ with tab_cargo:
 
 # Tab 3: Filtro por Unidade de Trabalho
 with tab_unidade:
-    # Verificar qual coluna de unidade existe
-    coluna_unidade = None
-    for possivel_coluna in ['Descrição da Unidade de Trabalho', 'Unidade de Trabalho', 'Unidade']:
-        if possivel_coluna in df.columns:
-            coluna_unidade = possivel_coluna
-            break
+    # Coluna de unidade detectada após o carregamento dos dados
+    coluna_unidade = st.session_state.get('coluna_unidade')
     
     if coluna_unidade:
         # Obter lista única de unidades e ordená-las alfabeticamente
@@ -957,23 +1265,13 @@ with tab_unidade:
         st.warning("Coluna de Unidade de Trabalho não encontrada no arquivo. O filtro não está disponível.")
         filtros_unidade = []
 
-# Aplicar os filtros ao dataframe
-df_filtrado = aplicar_filtros(df, filtro_abono, filtros_cargo, filtros_unidade)
+# Aplicar os filtros ao dataframe; o resultado e as agregações são reaproveitados
+# enquanto os dados e os filtros não mudarem
+contexto = obter_contexto(df, chave_dados, filtro_abono, filtros_cargo, filtros_unidade)
+df_filtrado = contexto.df_filtrado
 
 # Mostrar contadores com base nos filtros aplicados
-st.markdown(
-    f"""
-    <div style="
-        background-color: {cores_cbmpr['amarelo']};
-        padding: 12px 20px;
-        border-radius: 8px 8px 0 0;
-        margin-bottom: 0px;
-    ">
-        <h3 style="color: {cores_cbmpr['preto']}; margin: 0; font-size: 1.3em;">Estatísticas com base nos filtros aplicados</h3>
-    </div>
-    """,
-    unsafe_allow_html=True
-)
+st.markdown(HTML_CABECALHO_ESTATISTICAS, unsafe_allow_html=True)
 
 total_original = len(df)
 total_filtrado = len(df_filtrado)
@@ -986,55 +1284,30 @@ with col2:
 
 # Adicionar estatísticas de idade
 if 'Idade' in df_filtrado.columns:
-    # Remover valores nulos para cálculos
-    df_idade = df_filtrado.dropna(subset=['Idade'])
-    
-    if len(df_idade) > 0:  # Verificar se há dados após filtro
-        st.markdown(
-            f"""
-            <div style="
-                background-color: {cores_cbmpr['vermelho']};
-                padding: 12px 20px;
-                border-radius: 8px 8px 0 0;
-                margin-top: 20px;
-                margin-bottom: 0px;
-            ">
-                <h3 style="color: white; margin: 0; font-size: 1.3em;">Estatísticas de Idade</h3>
-            </div>
-            """,
-            unsafe_allow_html=True
-        )
+    # Remover valores nulos para cálculos, usando apenas o vetor de idades (sem copiar as demais colunas)
+    idades = df_filtrado['Idade'].to_numpy(dtype=np.float32, na_value=np.nan)
+    idades = idades[~np.isnan(idades)]
+    
+    if len(idades) > 0:  # Verificar se há dados após filtro
+        media, mediana, min_idade, max_idade = calcular_estatisticas_idade(idades)
+        
+        st.markdown(HTML_CABECALHO_IDADE, unsafe_allow_html=True)
         
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Idade Média", f"{df_idade['Idade'].mean():.1f} anos")
+            st.metric("Idade Média", f"{media:.1f} anos")
         with col2:
-            st.metric("Idade Mediana", f"{df_idade['Idade'].median():.1f} anos")
+            st.metric("Idade Mediana", f"{mediana:.1f} anos")
         with col3:
-            st.metric("Idade Mínima", f"{df_idade['Idade'].min():.0f} anos")
+            st.metric("Idade Mínima", f"{min_idade:.0f} anos")
         with col4:
-            st.metric("Idade Máxima", f"{df_idade['Idade'].max():.0f} anos")
+            st.metric("Idade Máxima", f"{max_idade:.0f} anos")
 
 # Se houver filtro de abono, mostrar estatísticas específicas
-if tem_coluna_abono:
-    total = len(df_filtrado)
-    recebe = len(df_filtrado[df_filtrado['Recebe Abono Permanência'] == 'S'])
-    nao_recebe = len(df_filtrado[df_filtrado['Recebe Abono Permanência'] == 'N'])
+if contexto.totais_abono is not None:
+    total, recebe, nao_recebe = contexto.totais_abono
     
-    st.markdown(
-        f"""
-        <div style="
-            background-color: {cores_cbmpr['cinza_escuro']};
-            padding: 12px 20px;
-            border-radius: 8px 8px 0 0;
-            margin-top: 20px;
-            margin-bottom: 0px;
-        ">
-            <h3 style="color: white; margin: 0; font-size: 1.3em;">Estatísticas de Abono Permanência</h3>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+    st.markdown(HTML_CABECALHO_ABONO, unsafe_allow_html=True)
     
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -1046,21 +1319,21 @@ if tem_coluna_abono:
 
 # Adicionar opção para download das estatísticas gerais
 if 'Idade' in df_filtrado.columns:
-    df_idade = df_filtrado.dropna(subset=['Idade'])
-    if len(df_idade) > 0:
+    # Reaproveitar o vetor de idades válidas calculado acima
+    if len(idades) > 0:
         # Tabela de estatísticas para download
         estatisticas = pd.DataFrame({
             'Estatística': ['Média', 'Mediana', 'Mínima', 'Máxima', 'Total de Militares'],
             'Valor': [
-                f"{df_idade['Idade'].mean():.1f} anos",
-                f"{df_idade['Idade'].median():.1f} anos",
-                f"{df_idade['Idade'].min():.0f} anos",
-                f"{df_idade['Idade'].max():.0f} anos",
-                f"{len(df_idade)}"
+                f"{media:.1f} anos",
+                f"{mediana:.1f} anos",
+                f"{min_idade:.0f} anos",
+                f"{max_idade:.0f} anos",
+                f"{len(idades)}"
             ]
         })
         
-        csv_estatisticas = estatisticas.to_csv(index=False).encode('utf-8')
+        csv_estatisticas = converter_para_csv(estatisticas)
         st.download_button(
             label="📥 Download das Estatísticas (CSV)",
             data=csv_estatisticas,
@@ -1069,35 +1342,10 @@ if 'Idade' in df_filtrado.columns:
         )
 
 # Seção de visualização
-st.markdown(
-    f"""
-    <div style="
-        background-color: {cores_cbmpr['azul_escuro']};
-        padding: 12px 20px;
-        border-radius: 8px 8px 0 0;
-        margin-top: 30px;
-        margin-bottom: 0px;
-    ">
-        <h2 style="color: white; margin: 0; font-size: 1.5em;">3. Visualizações</h2>
-    </div>
-    """,
-    unsafe_allow_html=True
-)
+st.markdown(HTML_CABECALHO_VISUALIZACOES, unsafe_allow_html=True)
 
 # Adicionar um fundo claro para a seção de visualização
-st.markdown(
-    f"""
-    <div style="
-        background-color: {cores_cbmpr['cinza_claro']}20;
-        padding: 10px 20px;
-        border-radius: 0 0 8px 8px;
-        margin-bottom: 20px;
-        border: 1px solid {cores_cbmpr['cinza_claro']}60;
-    ">
-    </div>
-    """,
-    unsafe_allow_html=True
-)
+st.markdown(HTML_FUNDO_SECAO, unsafe_allow_html=True)
 
 # Opções de visualização
 tipo_grafico = st.radio(
@@ -1107,54 +1355,33 @@ tipo_grafico = st.radio(
      "Distribuição por Unidade de Trabalho"]
 )
 
+# Resolução do PNG para download (300 dpi apenas quando solicitado, pois é bem mais lento)
+dpi_download = 300 if st.checkbox("Alta resolução no download do gráfico (300 dpi)", value=False) else 150
+
 # Nota: A partir daqui, usamos df_filtrado em vez de df para visualizações
 if tipo_grafico == "Distribuição por Faixas Etárias":
     st.subheader("Distribuição por Faixas Etárias")
-    # Usar dataframe já filtrado
-    fig = criar_grafico_faixas_etarias(df_filtrado, None)  # Filtro já aplicado
-    
-    if fig:
-        st.pyplot(fig)
+    # Usar as contagens já calculadas no contexto (dados filtrados); o PNG Matplotlib
+    # é usado apenas para download e só é gerado quando o usuário pede
+    if contexto.contagem_faixa is not None:
+        # Gráfico interativo na tela
+        st.plotly_chart(criar_grafico_interativo_faixas_etarias(contexto), use_container_width=True)
         
         # Opção para download do gráfico
-        buf = io.BytesIO()
-        fig.savefig(buf, format='png', dpi=300, bbox_inches='tight')
-        buf.seek(0)
-        
-        st.download_button(
-            label="📥 Download do Gráfico (PNG)",
-            data=buf,
-            file_name="faixas_etarias_cbmpr.png",
-            mime="image/png"
+        oferecer_download_png(
+            png_grafico_faixas_etarias, contexto.contagem_faixa, dpi_download, "faixas_etarias_cbmpr.png"
         )
         
         # Exibir tabela de faixas etárias
         st.subheader("Tabela de Faixas Etárias")
         
-        # Remover valores nulos do dataframe já filtrado
-        df_idade = df_filtrado.dropna(subset=['Idade'])
-        
-        # Definir faixas etárias
-        bins = [18, 25, 30, 35, 40, 45, 50, 55, 60]
-        labels = ['18-25', '26-30', '31-35', '36-40', '41-45', '46-50', '51-55', '56+']
-        
-        # Categorizar idades
-        df_idade['Faixa Etária'] = pd.cut(df_idade['Idade'], bins=bins, labels=labels, right=True)
-        
-        # Contagem por faixa etária
-        contagem = df_idade['Faixa Etária'].value_counts().sort_index()
-        percentual = (contagem / contagem.sum() * 100).round(2) if len(contagem) > 0 else pd.Series()
-        
-        tabela_faixas = pd.DataFrame({
-            'Faixa Etária': contagem.index,
-            'Quantidade': contagem.values,
-            'Percentual (%)': percentual.values
-        })
+        # Tabela montada uma única vez por combinação de filtros (ver obter_contexto)
+        tabela_faixas = contexto.tabela_faixas
         
         st.dataframe(tabela_faixas, use_container_width=True, hide_index=True)
         
         # Opção para download da tabela
-        csv = tabela_faixas.to_csv(index=False).encode('utf-8')
+        csv = converter_para_csv(tabela_faixas)
         st.download_button(
             label="📥 Download da Tabela (CSV)",
             data=csv,
@@ -1167,41 +1394,30 @@ if tipo_grafico == "Distribuição por Faixas Etárias":
 
 elif tipo_grafico == "Distribuição por Posto/Graduação":
     st.subheader("Distribuição por Posto/Graduação")
-    # Usar dataframe já filtrado
-    fig = criar_grafico_distribuicao_cargo(df_filtrado, None)  # Filtro já aplicado
-    
-    if fig:
-        st.pyplot(fig)
+    # Usar as contagens já calculadas no contexto (dados filtrados); o PNG Matplotlib
+    # é usado apenas para download e só é gerado quando o usuário pede
+    if contexto.contagem_cargo is None:
+        st.error("Coluna de Cargo (Posto/Graduação) não encontrada no arquivo.")
+    else:
+        # Gráfico interativo na tela
+        st.plotly_chart(criar_grafico_interativo_cargo(contexto), use_container_width=True)
         
         # Opção para download do gráfico
-        buf = io.BytesIO()
-        fig.savefig(buf, format='png', dpi=300, bbox_inches='tight')
-        buf.seek(0)
-        
-        st.download_button(
-            label="📥 Download do Gráfico (PNG)",
-            data=buf,
-            file_name="distribuicao_posto_graduacao_cbmpr.png",
-            mime="image/png"
+        oferecer_download_png(
+            png_grafico_distribuicao_cargo, contexto.contagem_cargo, dpi_download,
+            "distribuicao_posto_graduacao_cbmpr.png"
         )
         
         # Exibir tabela de cargos
         st.subheader("Tabela de Distribuição por Posto/Graduação")
         
-        # Contagem por cargo no dataframe já filtrado
-        contagem = df_filtrado['Cargo'].value_counts()
-        percentual = (contagem / contagem.sum() * 100).round(2) if len(contagem) > 0 else pd.Series()
-        
-        tabela_cargos = pd.DataFrame({
-            'Posto/Graduação': contagem.index,
-            'Quantidade': contagem.values,
-            'Percentual (%)': percentual.values
-        })
+        # Tabela montada uma única vez por combinação de filtros (ver obter_contexto)
+        tabela_cargos = contexto.tabela_cargos
         
         st.dataframe(tabela_cargos, use_container_width=True, hide_index=True)
         
         # Opção para download da tabela
-        csv = tabela_cargos.to_csv(index=False).encode('utf-8')
+        csv = converter_para_csv(tabela_cargos)
         st.download_button(
             label="📥 Download da Tabela (CSV)",
             data=csv,
@@ -1215,14 +1431,9 @@ elif tipo_grafico == "Distribuição por Posto/Graduação":
 else:  # Distribuição por Unidade de Trabalho
     st.subheader("Distribuição por Unidade de Trabalho")
     
-    # Verificar qual coluna de unidade existe
-    if 'Descrição da Unidade de Trabalho' in df_filtrado.columns:
-        coluna_unidade = 'Descrição da Unidade de Trabalho'
-    elif 'Unidade de Trabalho' in df_filtrado.columns:
-        coluna_unidade = 'Unidade de Trabalho'
-    elif 'Unidade' in df_filtrado.columns:
-        coluna_unidade = 'Unidade'
-    else:
+    # Coluna de unidade detectada após o carregamento dos dados
+    coluna_unidade = st.session_state.get('coluna_unidade')
+    if coluna_unidade is None:
         st.error("Coluna de Unidade de Trabalho não encontrada no arquivo.")
         adicionar_secao_amostra_dados(df_filtrado, None)  # Filtro já aplicado
         st.stop()
@@ -1230,16 +1441,13 @@ else:  # Distribuição por Unidade de Trabalho
     # Exibir tabela de unidades - ordenada alfabeticamente
     st.subheader("Tabela de Distribuição por Unidade de Trabalho")
     
-    # Contagem por unidade no dataframe já filtrado
-    contagem = df_filtrado[coluna_unidade].value_counts()
-    percentual = (contagem / contagem.sum() * 100).round(2) if len(contagem) > 0 else pd.Series()
+    # Contagem por unidade no dataframe já filtrado (apenas as unidades presentes);
+    # sem ordenar por quantidade, já que a tabela é ordenada pelo nome da unidade
+    contagem = df_filtrado[coluna_unidade].value_counts(sort=False)
+    contagem = contagem[contagem > 0]
     
     # Criar dataframe com contagens e ordenar alfabeticamente
-    tabela_unidades = pd.DataFrame({
-        'Unidade de Trabalho': contagem.index,
-        'Quantidade': contagem.values,
-        'Percentual (%)': percentual.values
-    })
+    tabela_unidades = montar_tabela_distribuicao(contagem, 'Unidade de Trabalho')
     
     # Ordenar por unidade (alfabética) em vez de por contagem
     tabela_unidades = tabela_unidades.sort_values('Unidade de Trabalho')
@@ -1247,7 +1455,7 @@ else:  # Distribuição por Unidade de Trabalho
     st.dataframe(tabela_unidades, use_container_width=True, hide_index=True)
     
     # Opção para download da tabela
-    csv = tabela_unidades.to_csv(index=False).encode('utf-8')
+    csv = converter_para_csv(tabela_unidades)
     st.download_button(
         label="📥 Download da Tabela (CSV)",
         data=csv,
@@ -1260,25 +1468,4 @@ else:  # Distribuição por Unidade de Trabalho
 
 # Rodapé
 st.markdown("---")
-st.markdown(
-    f"""
-    <div style="
-        background: linear-gradient(135deg, {cores_cbmpr['cinza_escuro']} 0%, {cores_cbmpr['azul_escuro']} 100%);
-        padding: 25px;
-        border-radius: 10px;
-        color: white;
-        text-align: center;
-        margin-top: 40px;
-        box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
-    ">
-        <p style="margin-bottom: 10px;"><strong>Dashboard desenvolvido para o Corpo de Bombeiros Militar do Paraná</strong></p>
-        <p style="margin: 0;">💻 Para mais informações, consulte o repositório no GitHub</p>
-        <div style="font-size: 30px; margin-top: 10px;">
-            <span style="margin: 0 10px; color: {cores_cbmpr['amarelo']};">🚒</span>
-            <span style="margin: 0 10px; color: {cores_cbmpr['vermelho']};">🔥</span>
-            <span style="margin: 0 10px; color: {cores_cbmpr['amarelo']};">🚒</span>
-        </div>
-    </div>
-    """,
-    unsafe_allow_html=True
-)
+st.markdown(HTML_RODAPE, unsafe_allow_html=True)